@@ -1,20 +1,45 @@
-from fastapi import FastAPI, HTTPException, Depends, Query
-from typing import List, Optional
+import itertools
+
+import orjson
+from fastapi import FastAPI, HTTPException, Depends, Query, Request
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from typing import Iterator, List, Optional
 from datetime import datetime, date
 from pydantic import BaseModel
 
 from .models import Product, StockMovement, MovementType, StockLevel
-from .database import Database
+from .database import Database, get_pool, get_stream_pool
+from .pool import PoolTimeout
+
+app = FastAPI(title="Bazaar Inventory API", default_response_class=ORJSONResponse)
+
+# Movement types that take stock away and so need enough stock on hand
+_DECREMENTING = frozenset({MovementType.SALE, MovementType.MANUAL_REMOVAL})
+
+
+@app.on_event("startup")
+def startup():
+    get_pool()
+    # Pydantic builds model validators at class definition, but FastAPI only
+    # generates the OpenAPI schema on first request to /docs; build it now
+    app.openapi()
+
+
+@app.on_event("shutdown")
+def shutdown():
+    get_pool().close()
+    get_stream_pool().close()
+
+
+@app.exception_handler(PoolTimeout)
+def pool_timeout_handler(request: Request, exc: PoolTimeout):
+    return ORJSONResponse(status_code=503, content={"detail": "Database busy, try again later"})
 
-app = FastAPI(title="Bazaar Inventory API")
 
 # Dependency to get database connection
 def get_db():
-    db = Database()
-    try:
-        yield db
-    finally:
-        db.close()
+    with get_pool().connection() as conn:
+        yield Database(conn)
 
 
 # API Models
@@ -55,42 +80,55 @@ class StockLevelResponse(BaseModel):
     product_id: int
     store_id: int
     quantity: int
-    last_updated: str
+    last_updated: Optional[str]
 
 
 # API Routes
+#
+# Responses are built with model_construct() and the routes set
+# response_model=None, so FastAPI does not re-validate them. This is safe
+# because every response is built from rows read back from our own database,
+# which only ever holds data that passed request validation on the way in.
+# The models are still listed under `responses` to keep the OpenAPI schema.
+# List routes go further and hand plain rows straight to ORJSONResponse,
+# skipping FastAPI's jsonable_encoder pass as well.
+#
+# Database routes stay plain `def`: FastAPI runs them on its threadpool, where
+# pooled sqlite3 connections release the GIL while SQLite works and WAL lets
+# readers run in parallel. Routes that do no I/O are `async def` so they skip
+# the threadpool hop.
 @app.get("/")
-def read_root():
+async def read_root():
     return {"message": "Welcome to Bazaar Inventory API"}
 
 
-@app.post("/products/", response_model=ProductResponse)
+@app.post("/products/", response_model=None, responses={200: {"model": ProductResponse}})
 def create_product(product: ProductCreate, db: Database = Depends(get_db)):
     # Check if product with SKU already exists
     existing = db.get_product_by_sku(product.sku)
     if existing:
         raise HTTPException(status_code=400, detail="Product with this SKU already exists")
     
-    product_obj = Product(**product.dict())
+    product_obj = Product(**product.model_dump())
     product_id = db.add_product(product_obj)
     
-    return db.get_product(product_id)
+    return ProductResponse.model_construct(**db.get_product(product_id))
 
 
-@app.get("/products/", response_model=List[ProductResponse])
+@app.get("/products/", response_model=None, responses={200: {"model": List[ProductResponse]}})
 def list_products(db: Database = Depends(get_db)):
-    return db.get_all_products()
+    return ORJSONResponse(db.get_all_products())
 
 
-@app.get("/products/{product_id}", response_model=ProductResponse)
+@app.get("/products/{product_id}", response_model=None, responses={200: {"model": ProductResponse}})
 def get_product(product_id: int, db: Database = Depends(get_db)):
     product = db.get_product(product_id)
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
-    return product
+    return ProductResponse.model_construct(**product)
 
 
-@app.post("/stock-movements/", response_model=StockMovementResponse)
+@app.post("/stock-movements/", response_model=None, responses={200: {"model": StockMovementResponse}})
 def create_stock_movement(movement: StockMovementCreate, db: Database = Depends(get_db)):
     # Validate product exists
     product = db.get_product(movement.product_id)
@@ -98,7 +136,7 @@ def create_stock_movement(movement: StockMovementCreate, db: Database = Depends(
         raise HTTPException(status_code=404, detail="Product not found")
     
     # For sales or removals, check if enough stock is available
-    if movement.movement_type in [MovementType.SALE, MovementType.MANUAL_REMOVAL]:
+    if movement.movement_type in _DECREMENTING:
         stock_level = db.get_stock_level(movement.product_id, movement.store_id)
         if stock_level["quantity"] < movement.quantity:
             raise HTTPException(
@@ -106,30 +144,84 @@ def create_stock_movement(movement: StockMovementCreate, db: Database = Depends(
                 detail=f"Insufficient stock. Available: {stock_level['quantity']}"
             )
     
-    movement_obj = StockMovement(**movement.dict())
-    movement_id = db.record_stock_movement(movement_obj)
-    
-    # Get the created movement
-    all_movements = db.get_stock_movements(product_id=movement.product_id)
-    for m in all_movements:
-        if m["id"] == movement_id:
-            return m
-    
-    # This should not happen, but just in case
-    raise HTTPException(status_code=500, detail="Failed to retrieve created stock movement")
+    movement_obj = StockMovement(**movement.model_dump())
+    return StockMovementResponse.model_construct(**db.record_stock_movement(movement_obj))
 
 
-@app.get("/stock-movements/", response_model=List[StockMovementResponse])
+@app.post("/stock-movements/bulk", response_model=None, responses={200: {"model": List[StockMovementResponse]}})
+def create_stock_movements_bulk(
+    movements: List[StockMovementCreate],
+    db: Database = Depends(get_db)
+):
+    # Walk the movements in order, tracking stock as earlier ones would change it
+    available = {}
+    for index, movement in enumerate(movements):
+        key = (movement.product_id, movement.store_id)
+        if key not in available:
+            # Validate product exists
+            if not db.get_product(movement.product_id):
+                raise HTTPException(
+                    status_code=404,
+                    detail=f"Product not found for movement {index}"
+                )
+            available[key] = db.get_stock_level(*key)["quantity"]
+
+        if movement.movement_type in _DECREMENTING:
+            if available[key] < movement.quantity:
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"Insufficient stock for movement {index}. Available: {available[key]}"
+                )
+            available[key] -= movement.quantity
+        else:
+            available[key] += movement.quantity
+
+    movement_objs = [StockMovement(**movement.model_dump()) for movement in movements]
+    return [
+        StockMovementResponse.model_construct(**row)
+        for row in db.record_stock_movements_bulk(movement_objs)
+    ]
+
+
+@app.get("/stock-movements/", response_model=None, responses={200: {"model": List[StockMovementResponse]}})
 def list_stock_movements(
     product_id: Optional[int] = None,
     store_id: Optional[int] = None,
-    movement_type: Optional[MovementType] = None,
-    db: Database = Depends(get_db)
+    movement_type: Optional[MovementType] = None
 ):
-    return db.get_stock_movements(product_id, store_id, movement_type)
+    # The body is sent after the route returns, so the stream holds its own
+    # connection rather than the one from get_db. Taking it here means a busy
+    # pool is still reported as a 503 before any of the body is sent.
+    conn = get_stream_pool().acquire()
+    chunks = _stream_stock_movements(conn, product_id, store_id, movement_type)
+    # Start the generator so its finally releases conn even if the body is
+    # never sent
+    first = next(chunks)
+    return StreamingResponse(
+        itertools.chain((first,), chunks),
+        media_type="application/json"
+    )
+
+
+def _stream_stock_movements(
+    conn,
+    product_id: Optional[int],
+    store_id: Optional[int],
+    movement_type: Optional[MovementType]
+) -> Iterator[bytes]:
+    """Encode stock movements as a JSON array one row at a time, then release conn"""
+    try:
+        yield b"["
+        separator = b""
+        for row in Database(conn).iter_stock_movements(product_id, store_id, movement_type):
+            yield separator + orjson.dumps(row)
+            separator = b","
+        yield b"]"
+    finally:
+        get_stream_pool().release(conn)
 
 
-@app.get("/stock-levels/{product_id}", response_model=StockLevelResponse)
+@app.get("/stock-levels/{product_id}", response_model=None, responses={200: {"model": StockLevelResponse}})
 def get_stock_level(
     product_id: int, 
     store_id: int = 1,
@@ -140,4 +232,4 @@ def get_stock_level(
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
     
-    return db.get_stock_level(product_id, store_id)
+    return StockLevelResponse.model_construct(**db.get_stock_level(product_id, store_id))
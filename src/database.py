@@ -1,199 +1,429 @@
 import os
 import sqlite3
-from datetime import datetime
-from typing import List, Dict, Any, Optional, Tuple
+import threading
+from collections import defaultdict
+from typing import List, Dict, Any, Iterator, Optional, Tuple
+
+from cachetools import TTLCache
 
 from .models import Product, StockMovement, StockLevel, MovementType
+from .pool import Pool
+
+# Products rarely change but are looked up on most requests, so lookups by ID
+# and SKU are cached process-wide, shared by every pooled connection
+_product_cache = TTLCache(maxsize=1024, ttl=60)
+_product_cache_lock = threading.RLock()
+
+# Direction each movement type moves the stock level in
+_SIGN = {
+    MovementType.STOCK_IN: 1,
+    MovementType.SALE: -1,
+    MovementType.MANUAL_REMOVAL: -1,
+}
+
+# Current local time in the same ISO-8601 shape datetime.now().isoformat()
+# wrote before timestamps moved into SQL, so old and new rows sort together
+_NOW = "strftime('%Y-%m-%dT%H:%M:%f', 'now', 'localtime')"
+
+# SQL statements, built once at import instead of inside each call
+_SQL_INSERT_PRODUCT = f'''
+INSERT INTO products (name, description, sku, created_at, updated_at)
+VALUES (?, ?, ?, {_NOW}, {_NOW})
+'''
+
+_SQL_GET_PRODUCT = 'SELECT * FROM products WHERE id = ?'
+
+_SQL_GET_PRODUCT_BY_SKU = 'SELECT * FROM products WHERE sku = ?'
+
+_SQL_GET_ALL_PRODUCTS = 'SELECT * FROM products'
+
+_SQL_LIST_PRODUCTS_WITH_STOCK = '''
+SELECT p.*, COALESCE(sl.quantity, 0) AS quantity FROM products p
+LEFT JOIN stock_levels sl ON sl.product_id = p.id AND sl.store_id = ?
+'''
+
+_SQL_INSERT_MOVEMENT = f'''
+INSERT INTO stock_movements 
+(product_id, store_id, quantity, movement_type, notes, created_at)
+VALUES (?, ?, ?, ?, ?, {_NOW})
+RETURNING id, product_id, store_id, quantity, movement_type, notes, created_at
+'''
+
+_SQL_INSERT_MOVEMENTS_BULK = f'''
+INSERT INTO stock_movements 
+(product_id, store_id, quantity, movement_type, notes, created_at)
+VALUES (?, ?, ?, ?, ?, {_NOW})
+'''
+
+_SQL_GET_LAST_MOVEMENT_ID = 'SELECT COALESCE(MAX(id), 0) FROM stock_movements'
+
+_SQL_GET_MOVEMENTS_AFTER = 'SELECT * FROM stock_movements WHERE id > ? ORDER BY id'
+
+_SQL_UPSERT_STOCK_LEVEL = f'''
+INSERT INTO stock_levels 
+(product_id, store_id, quantity, last_updated)
+VALUES (?, ?, ?, {_NOW})
+ON CONFLICT (product_id, store_id) DO UPDATE
+SET quantity = quantity + excluded.quantity,
+    last_updated = {_NOW}
+'''
+
+_SQL_GET_STOCK_LEVEL = '''
+SELECT * FROM stock_levels 
+WHERE product_id = ? AND store_id = ?
+'''
+
+
+def _movement_queries(select: str) -> Tuple[str, ...]:
+    """Build one query per filter combination, indexed like _MOVEMENT_PARAMS"""
+    queries = []
+    for key in range(8):
+        where = "1=1"
+        if key & 4:
+            where += " AND m.product_id = ?"
+        if key & 2:
+            where += " AND m.store_id = ?"
+        if key & 1:
+            where += " AND m.movement_type = ?"
+        queries.append(f"{select} WHERE {where} ORDER BY m.created_at DESC, m.id DESC")
+    return tuple(queries)
+
+
+_SQL_GET_STOCK_MOVEMENTS = _movement_queries("SELECT m.* FROM stock_movements m")
+
+_SQL_GET_MOVEMENTS_WITH_PRODUCT_NAME = _movement_queries(
+    "SELECT m.*, p.name AS product_name FROM stock_movements m "
+    "LEFT JOIN products p ON p.id = m.product_id"
+)
+
+# Params for each filter combination, in the order its query expects them
+_MOVEMENT_PARAMS = (
+    lambda product_id, store_id, movement_type: (),
+    lambda product_id, store_id, movement_type: (movement_type,),
+    lambda product_id, store_id, movement_type: (store_id,),
+    lambda product_id, store_id, movement_type: (store_id, movement_type),
+    lambda product_id, store_id, movement_type: (product_id,),
+    lambda product_id, store_id, movement_type: (product_id, movement_type),
+    lambda product_id, store_id, movement_type: (product_id, store_id),
+    lambda product_id, store_id, movement_type: (product_id, store_id, movement_type),
+)
+
+
+def bootstrap(db_path: str = "inventory.db"):
+    """Create database and tables if they don't exist"""
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    
+    with _product_cache_lock:
+        _product_cache.clear()
+    
+    # WAL is persisted in the database file, so it only has to be set once
+    cursor.execute("PRAGMA journal_mode=WAL")
+    
+    # Create Products table
+    cursor.execute(f'''
+    CREATE TABLE IF NOT EXISTS products (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL,
+        description TEXT,
+        sku TEXT UNIQUE NOT NULL,
+        created_at TIMESTAMP DEFAULT ({_NOW}),
+        updated_at TIMESTAMP DEFAULT ({_NOW})
+    )
+    ''')
+    
+    # Create StockMovements table
+    cursor.execute(f'''
+    CREATE TABLE IF NOT EXISTS stock_movements (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        product_id INTEGER NOT NULL,
+        store_id INTEGER DEFAULT 1,
+        quantity INTEGER NOT NULL,
+        movement_type TEXT NOT NULL,
+        notes TEXT,
+        created_at TIMESTAMP DEFAULT ({_NOW}),
+        FOREIGN KEY (product_id) REFERENCES products (id)
+    )
+    ''')
+    
+    # Create StockLevels table
+    cursor.execute(f'''
+    CREATE TABLE IF NOT EXISTS stock_levels (
+        product_id INTEGER NOT NULL,
+        store_id INTEGER DEFAULT 1,
+        quantity INTEGER NOT NULL DEFAULT 0,
+        last_updated TIMESTAMP DEFAULT ({_NOW}),
+        PRIMARY KEY (product_id, store_id),
+        FOREIGN KEY (product_id) REFERENCES products (id)
+    )
+    ''')
+    
+    # Create Stores table (for future use)
+    cursor.execute(f'''
+    CREATE TABLE IF NOT EXISTS stores (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL,
+        location TEXT,
+        created_at TIMESTAMP DEFAULT ({_NOW})
+    )
+    ''')
+    
+    # Insert default store for Stage 1
+    cursor.execute(f'''
+    INSERT OR IGNORE INTO stores (id, name, location, created_at)
+    VALUES (1, 'Default Store', 'Default Location', {_NOW})
+    ''')
+    
+    # Note which objects exist before the indexes below are created
+    cursor.execute("SELECT name FROM sqlite_master WHERE type IN ('index', 'table')")
+    existing = {row[0] for row in cursor.fetchall()}
+    
+    # Indexes for the stock movement history filters. They are ascending so
+    # SQLite can walk them backwards for ORDER BY created_at DESC, id DESC;
+    # a DESC column would leave the id tie-break to a temp B-tree sort
+    cursor.execute("DROP INDEX IF EXISTS idx_movements_product_created")
+    cursor.execute("DROP INDEX IF EXISTS idx_movements_store_type_created")
+    cursor.execute("DROP INDEX IF EXISTS idx_movements_store_type_time")
+    cursor.execute('''
+    CREATE INDEX IF NOT EXISTS idx_movements_product_time
+    ON stock_movements (product_id, created_at)
+    ''')
+    # A type filter is checked row by row, as for idx_movements_time, so
+    # that store and store+type history are also read in order
+    cursor.execute('''
+    CREATE INDEX IF NOT EXISTS idx_movements_store_time
+    ON stock_movements (store_id, created_at)
+    ''')
+    # Lets the unfiltered and type-only history be read in order rather than
+    # sorted whole before the first row comes back
+    cursor.execute('''
+    CREATE INDEX IF NOT EXISTS idx_movements_time
+    ON stock_movements (created_at)
+    ''')
+    
+    conn.commit()
+    
+    # Full ANALYZE scans every index, so only pay for it when an index is new
+    # or there are no statistics yet; otherwise let SQLite decide what to do
+    indexes = {"idx_movements_product_time", "idx_movements_store_time", "idx_movements_time"}
+    if "sqlite_stat1" not in existing or not indexes <= existing:
+        cursor.execute("ANALYZE")
+    else:
+        cursor.execute("PRAGMA optimize")
+    conn.close()
+
+
+# Process-wide pool shared by the CLI and the API. Streamed responses hold a
+# connection for as long as the client takes to read them, so they get their
+# own small pool and can't starve the connections other routes need
+_pool: Optional[Pool] = None
+_stream_pool: Optional[Pool] = None
+_pool_lock = threading.Lock()
+
+
+def get_pool(db_path: str = "inventory.db") -> Pool:
+    """Get the shared connection pool, bootstrapping the database on first use"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            bootstrap(db_path)
+            _pool = Pool(db_path)
+        return _pool
+
+
+def get_stream_pool(db_path: str = "inventory.db") -> Pool:
+    """Get the connection pool for streamed responses"""
+    global _stream_pool
+    get_pool(db_path)
+    with _pool_lock:
+        if _stream_pool is None:
+            _stream_pool = Pool(db_path, maxsize=4, timeout=5.0)
+        return _stream_pool
+
+
+# Connections return plain tuples; these helpers turn them into dicts, looking
+# up the column names once per query instead of once per row like sqlite3.Row
+def _columns(cursor: sqlite3.Cursor) -> Tuple[str, ...]:
+    """Column names of the cursor's current result"""
+    return tuple(column[0] for column in cursor.description)
+
+
+def _fetch_dict(cursor: sqlite3.Cursor) -> Optional[Dict[str, Any]]:
+    """Fetch the next row as a dict, or None if there are no more rows"""
+    row = cursor.fetchone()
+    if row is None:
+        return None
+    return dict(zip(_columns(cursor), row))
+
+
+def _rows_to_dicts(cursor: sqlite3.Cursor) -> List[Dict[str, Any]]:
+    """Fetch all remaining rows as dicts"""
+    columns = _columns(cursor)
+    return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+
+def _movement_row(movement: Dict[str, Any]) -> Dict[str, Any]:
+    """Convert movement_type in a stock_movements row to a MovementType"""
+    movement["movement_type"] = MovementType(movement["movement_type"])
+    return movement
+
+
+def _movement_filters(
+    product_id: Optional[int],
+    store_id: Optional[int],
+    movement_type: Optional[MovementType]
+) -> Tuple[int, Tuple[Any, ...]]:
+    """Pick the pre-built movement query for the given filters and its params"""
+    key = bool(product_id) << 2 | bool(store_id) << 1 | bool(movement_type)
+    return key, _MOVEMENT_PARAMS[key](product_id, store_id, movement_type)
 
 
 class Database:
-    def __init__(self, db_path="inventory.db"):
-        self.db_path = db_path
-        self.conn = None
-        self.initialize_db()
-    
-    def initialize_db(self):
-        """Create database and tables if they don't exist"""
-        self.conn = sqlite3.connect(self.db_path)
-        self.conn.row_factory = sqlite3.Row
-        cursor = self.conn.cursor()
-        
-        # Create Products table
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS products (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL,
-            description TEXT,
-            sku TEXT UNIQUE NOT NULL,
-            created_at TIMESTAMP,
-            updated_at TIMESTAMP
-        )
-        ''')
-        
-        # Create StockMovements table
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS stock_movements (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            product_id INTEGER NOT NULL,
-            store_id INTEGER DEFAULT 1,
-            quantity INTEGER NOT NULL,
-            movement_type TEXT NOT NULL,
-            notes TEXT,
-            created_at TIMESTAMP,
-            FOREIGN KEY (product_id) REFERENCES products (id)
-        )
-        ''')
-        
-        # Create StockLevels table
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS stock_levels (
-            product_id INTEGER NOT NULL,
-            store_id INTEGER DEFAULT 1,
-            quantity INTEGER NOT NULL DEFAULT 0,
-            last_updated TIMESTAMP,
-            PRIMARY KEY (product_id, store_id),
-            FOREIGN KEY (product_id) REFERENCES products (id)
-        )
-        ''')
-        
-        # Create Stores table (for future use)
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS stores (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL,
-            location TEXT,
-            created_at TIMESTAMP
-        )
-        ''')
-        
-        # Insert default store for Stage 1
-        cursor.execute('''
-        INSERT OR IGNORE INTO stores (id, name, location, created_at)
-        VALUES (1, 'Default Store', 'Default Location', ?)
-        ''', (datetime.now().isoformat(),))
-        
-        self.conn.commit()
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
     
     def add_product(self, product: Product) -> int:
         """Add a new product and return its ID"""
         cursor = self.conn.cursor()
-        now = datetime.now().isoformat()
         
         cursor.execute(
-            '''
-            INSERT INTO products (name, description, sku, created_at, updated_at)
-            VALUES (?, ?, ?, ?, ?)
-            ''',
-            (product.name, product.description, product.sku, now, now)
+            _SQL_INSERT_PRODUCT,
+            (product.name, product.description, product.sku)
         )
         self.conn.commit()
         
+        with _product_cache_lock:
+            _product_cache.pop(("id", cursor.lastrowid), None)
+            _product_cache.pop(("sku", product.sku), None)
+        
         return cursor.lastrowid
     
+    def _get_cached_product(self, key: Tuple[str, Any], sql: str) -> Optional[Dict[str, Any]]:
+        """Get a product through the product cache, querying SQLite on a miss"""
+        with _product_cache_lock:
+            product = _product_cache.get(key)
+        
+        if product is None:
+            cursor = self.conn.cursor()
+            cursor.execute(sql, (key[1],))
+            product = _fetch_dict(cursor)
+            
+            # Misses are not cached so a product is visible as soon as it is added
+            if product is None:
+                return None
+            
+            with _product_cache_lock:
+                _product_cache[key] = product
+        
+        # Hand out a copy so callers can't modify the cached entry
+        return dict(product)
+    
     def get_product(self, product_id: int) -> Optional[Dict[str, Any]]:
         """Get a product by ID"""
-        cursor = self.conn.cursor()
-        cursor.execute('SELECT * FROM products WHERE id = ?', (product_id,))
-        row = cursor.fetchone()
-        
-        if row:
-            return dict(row)
-        return None
+        return self._get_cached_product(("id", product_id), _SQL_GET_PRODUCT)
     
     def get_product_by_sku(self, sku: str) -> Optional[Dict[str, Any]]:
         """Get a product by SKU"""
-        cursor = self.conn.cursor()
-        cursor.execute('SELECT * FROM products WHERE sku = ?', (sku,))
-        row = cursor.fetchone()
-        
-        if row:
-            return dict(row)
-        return None
+        return self._get_cached_product(("sku", sku), _SQL_GET_PRODUCT_BY_SKU)
     
     def get_all_products(self) -> List[Dict[str, Any]]:
         """Get all products"""
         cursor = self.conn.cursor()
-        cursor.execute('SELECT * FROM products')
-        return [dict(row) for row in cursor.fetchall()]
+        cursor.execute(_SQL_GET_ALL_PRODUCTS)
+        return _rows_to_dicts(cursor)
+    
+    def list_products_with_stock(self, store_id: int = 1) -> List[Dict[str, Any]]:
+        """Get all products, each with its current quantity at a store"""
+        cursor = self.conn.cursor()
+        cursor.execute(_SQL_LIST_PRODUCTS_WITH_STOCK, (store_id,))
+        return _rows_to_dicts(cursor)
     
-    def record_stock_movement(self, movement: StockMovement) -> int:
-        """Record a stock movement and update stock levels"""
+    def record_stock_movement(self, movement: StockMovement) -> Dict[str, Any]:
+        """Record a stock movement, update stock levels and return the new movement"""
         cursor = self.conn.cursor()
-        now = datetime.now().isoformat()
         
-        # Insert the movement record
-        cursor.execute(
-            '''
-            INSERT INTO stock_movements 
-            (product_id, store_id, quantity, movement_type, notes, created_at)
-            VALUES (?, ?, ?, ?, ?, ?)
-            ''',
-            (
-                movement.product_id, 
-                movement.store_id, 
-                movement.quantity, 
-                movement.movement_type, 
-                movement.notes, 
-                now
-            )
-        )
+        quantity_change = movement.quantity * _SIGN[movement.movement_type]
         
-        # Update stock levels
-        quantity_change = movement.quantity
-        if movement.movement_type in [MovementType.SALE, MovementType.MANUAL_REMOVAL]:
-            quantity_change = -quantity_change
+        # Movement and level change commit together in a single write transaction
+        with self.conn:
+            cursor.execute("BEGIN IMMEDIATE")
+            
+            # Insert the movement record
+            cursor.execute(
+                _SQL_INSERT_MOVEMENT,
+                (
+                    movement.product_id, 
+                    movement.store_id, 
+                    movement.quantity, 
+                    movement.movement_type, 
+                    movement.notes
+                )
+            )
+            recorded = _fetch_dict(cursor)
+            
+            # Create or update the stock level in one statement
+            cursor.execute(
+                _SQL_UPSERT_STOCK_LEVEL,
+                (movement.product_id, movement.store_id, quantity_change)
+            )
         
-        # Check if record exists
-        cursor.execute(
-            '''
-            SELECT quantity FROM stock_levels 
-            WHERE product_id = ? AND store_id = ?
-            ''',
-            (movement.product_id, movement.store_id)
-        )
+        return _movement_row(recorded)
+    
+    def record_stock_movements_bulk(self, movements: List[StockMovement]) -> List[Dict[str, Any]]:
+        """Record many stock movements in one transaction and return the new movements"""
+        cursor = self.conn.cursor()
         
-        row = cursor.fetchone()
+        # Net change per product and store, so each stock level is written once
+        quantity_changes = defaultdict(int)
+        for movement in movements:
+            quantity_changes[movement.product_id, movement.store_id] += (
+                movement.quantity * _SIGN[movement.movement_type]
+            )
         
-        if row:
-            # Update existing record
-            cursor.execute(
-                '''
-                UPDATE stock_levels 
-                SET quantity = quantity + ?, last_updated = ?
-                WHERE product_id = ? AND store_id = ?
-                ''',
-                (quantity_change, now, movement.product_id, movement.store_id)
+        with self.conn:
+            cursor.execute("BEGIN IMMEDIATE")
+            
+            # Nothing else can insert while we hold the write lock, so every
+            # movement after the current last ID is one of ours
+            cursor.execute(_SQL_GET_LAST_MOVEMENT_ID)
+            last_id = cursor.fetchone()[0]
+            
+            cursor.executemany(
+                _SQL_INSERT_MOVEMENTS_BULK,
+                [
+                    (
+                        movement.product_id, 
+                        movement.store_id, 
+                        movement.quantity, 
+                        movement.movement_type, 
+                        movement.notes
+                    )
+                    for movement in movements
+                ]
             )
-        else:
-            # Insert new record
-            cursor.execute(
-                '''
-                INSERT INTO stock_levels 
-                (product_id, store_id, quantity, last_updated)
-                VALUES (?, ?, ?, ?)
-                ''',
-                (movement.product_id, movement.store_id, quantity_change, now)
+            cursor.executemany(
+                _SQL_UPSERT_STOCK_LEVEL,
+                [
+                    (product_id, store_id, quantity_change)
+                    for (product_id, store_id), quantity_change in quantity_changes.items()
+                ]
             )
+            
+            cursor.execute(_SQL_GET_MOVEMENTS_AFTER, (last_id,))
+            recorded = _rows_to_dicts(cursor)
         
-        self.conn.commit()
-        return cursor.lastrowid
+        return [_movement_row(movement) for movement in recorded]
     
     def get_stock_level(self, product_id: int, store_id: int = 1) -> Dict[str, Any]:
         """Get current stock level for a product"""
         cursor = self.conn.cursor()
-        cursor.execute(
-            '''
-            SELECT * FROM stock_levels 
-            WHERE product_id = ? AND store_id = ?
-            ''',
-            (product_id, store_id)
-        )
+        cursor.execute(_SQL_GET_STOCK_LEVEL, (product_id, store_id))
         
-        row = cursor.fetchone()
+        stock_level = _fetch_dict(cursor)
         
-        if row:
-            return dict(row)
-        return {"product_id": product_id, "store_id": store_id, "quantity": 0}
+        if stock_level:
+            return stock_level
+        return {"product_id": product_id, "store_id": store_id, "quantity": 0, "last_updated": None}
     
     def get_stock_movements(
         self, 
@@ -202,29 +432,37 @@ class Database:
         movement_type: Optional[MovementType] = None
     ) -> List[Dict[str, Any]]:
         """Get stock movements with optional filters"""
+        return list(self.iter_stock_movements(product_id, store_id, movement_type))
+    
+    def iter_stock_movements(
+        self, 
+        product_id: Optional[int] = None,
+        store_id: Optional[int] = None,
+        movement_type: Optional[MovementType] = None,
+        chunk_size: int = 256
+    ) -> Iterator[Dict[str, Any]]:
+        """Iterate over stock movements with optional filters, fetching chunk_size rows at a time"""
         cursor = self.conn.cursor()
-        query = "SELECT * FROM stock_movements WHERE 1=1"
-        params = []
-        
-        if product_id:
-            query += " AND product_id = ?"
-            params.append(product_id)
+        key, params = _movement_filters(product_id, store_id, movement_type)
         
-        if store_id:
-            query += " AND store_id = ?"
-            params.append(store_id)
-        
-        if movement_type:
-            query += " AND movement_type = ?"
-            params.append(movement_type)
-        
-        query += " ORDER BY created_at DESC"
+        cursor.execute(_SQL_GET_STOCK_MOVEMENTS[key], params)
+        columns = _columns(cursor)
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            for row in rows:
+                yield _movement_row(dict(zip(columns, row)))
+    
+    def get_movements_with_product_name(
+        self, 
+        product_id: Optional[int] = None,
+        store_id: Optional[int] = None,
+        movement_type: Optional[MovementType] = None
+    ) -> List[Dict[str, Any]]:
+        """Get stock movements with optional filters, each with its product_name"""
+        cursor = self.conn.cursor()
+        key, params = _movement_filters(product_id, store_id, movement_type)
         
-        cursor.execute(query, params)
-        return [dict(row) for row in cursor.fetchall()]
-    
-    def close(self):
-        """Close the database connection"""
-        if self.conn:
-            self.conn.close()
-            self.conn = None
+        cursor.execute(_SQL_GET_MOVEMENTS_WITH_PRODUCT_NAME[key], params)
+        return [_movement_row(movement) for movement in _rows_to_dicts(cursor)]
@@ -1,14 +1,21 @@
 import os
+import functools
 import click
 import uvicorn
 from datetime import datetime
 
-from .database import Database
+from .database import Database, get_pool
 from .models import Product, StockMovement, MovementType
 from .api import app
 
-# Initialize database
-db = Database()
+
+def with_db(f):
+    """Pass the command a Database on a connection from the shared pool"""
+    @functools.wraps(f)
+    def wrapper(*args, **kwargs):
+        with get_pool().connection() as conn:
+            return f(Database(conn), *args, **kwargs)
+    return wrapper
 
 
 @click.group()
@@ -28,7 +35,8 @@ def product():
 @click.option("--name", required=True, help="Product name")
 @click.option("--description", required=True, help="Product description")
 @click.option("--sku", required=True, help="Product SKU (Stock Keeping Unit)")
-def add_product(name, description, sku):
+@with_db
+def add_product(db, name, description, sku):
     """Add a new product"""
     product = Product(name=name, description=description, sku=sku)
     
@@ -40,9 +48,10 @@ def add_product(name, description, sku):
 
 
 @product.command("list")
-def list_products():
+@with_db
+def list_products(db):
     """List all products"""
-    products = db.get_all_products()
+    products = db.list_products_with_stock()
     
     if not products:
         click.echo("No products found")
@@ -54,10 +63,9 @@ def list_products():
     click.echo("-" * 80)
     
     for product in products:
-        stock = db.get_stock_level(product["id"])
         click.echo(
             f"{product['id']:<5} {product['sku']:<15} {product['name']:<25} "
-            f"{stock['quantity']:<15} {product['description'][:20]:<20}"
+            f"{product['quantity']:<15} {product['description'][:20]:<20}"
         )
 
 
@@ -72,7 +80,8 @@ def stock():
 @click.option("--product-id", type=int, required=True, help="Product ID")
 @click.option("--quantity", type=int, required=True, help="Quantity to add")
 @click.option("--notes", help="Optional notes")
-def stock_in(product_id, quantity, notes):
+@with_db
+def stock_in(db, product_id, quantity, notes):
     """Add stock for a product"""
     if quantity <= 0:
         click.echo("Quantity must be positive")
@@ -92,7 +101,7 @@ def stock_in(product_id, quantity, notes):
     )
     
     try:
-        movement_id = db.record_stock_movement(movement)
+        db.record_stock_movement(movement)
         stock = db.get_stock_level(product_id)
         click.echo(
             f"Stock added successfully. Current stock for {product['name']}: {stock['quantity']}"
@@ -105,7 +114,8 @@ def stock_in(product_id, quantity, notes):
 @click.option("--product-id", type=int, required=True, help="Product ID")
 @click.option("--quantity", type=int, required=True, help="Quantity to sell")
 @click.option("--notes", help="Optional notes")
-def sell(product_id, quantity, notes):
+@with_db
+def sell(db, product_id, quantity, notes):
     """Record sale of a product"""
     if quantity <= 0:
         click.echo("Quantity must be positive")
@@ -133,7 +143,7 @@ def sell(product_id, quantity, notes):
     )
     
     try:
-        movement_id = db.record_stock_movement(movement)
+        db.record_stock_movement(movement)
         stock = db.get_stock_level(product_id)
         click.echo(
             f"Sale recorded successfully. Current stock for {product['name']}: {stock['quantity']}"
@@ -146,7 +156,8 @@ def sell(product_id, quantity, notes):
 @click.option("--product-id", type=int, required=True, help="Product ID")
 @click.option("--quantity", type=int, required=True, help="Quantity to remove")
 @click.option("--notes", required=True, help="Reason for removal")
-def remove(product_id, quantity, notes):
+@with_db
+def remove(db, product_id, quantity, notes):
     """Manually remove stock (damaged, lost, etc.)"""
     if quantity <= 0:
         click.echo("Quantity must be positive")
@@ -174,7 +185,7 @@ def remove(product_id, quantity, notes):
     )
     
     try:
-        movement_id = db.record_stock_movement(movement)
+        db.record_stock_movement(movement)
         stock = db.get_stock_level(product_id)
         click.echo(
             f"Stock removed successfully. Current stock for {product['name']}: {stock['quantity']}"
@@ -185,7 +196,8 @@ def remove(product_id, quantity, notes):
 
 @stock.command("level")
 @click.option("--product-id", type=int, required=True, help="Product ID")
-def stock_level(product_id):
+@with_db
+def stock_level(db, product_id):
     """Check current stock level for a product"""
     # Check if product exists
     product = db.get_product(product_id)
@@ -201,13 +213,16 @@ def stock_level(product_id):
 @click.option("--product-id", type=int, help="Filter by product ID")
 @click.option("--movement-type", type=click.Choice(['stock_in', 'sale', 'manual_removal']), 
               help="Filter by movement type")
-def stock_history(product_id, movement_type):
+@with_db
+def stock_history(db, product_id, movement_type):
     """View stock movement history"""
     movement_type_enum = None
     if movement_type:
         movement_type_enum = MovementType(movement_type)
     
-    movements = db.get_stock_movements(product_id=product_id, movement_type=movement_type_enum)
+    movements = db.get_movements_with_product_name(
+        product_id=product_id, movement_type=movement_type_enum
+    )
     
     if not movements:
         click.echo("No stock movements found")
@@ -221,15 +236,16 @@ def stock_history(product_id, movement_type):
     click.echo("-" * 100)
     
     for m in movements:
-        # Get product name for better display
-        product = db.get_product(m["product_id"])
-        product_display = f"{m['product_id']} ({product['name']})" if product else m["product_id"]
+        # Show product name for better display
+        product_display = (
+            f"{m['product_id']} ({m['product_name']})" if m["product_name"] else m["product_id"]
+        )
         
         # Format date
         date_str = datetime.fromisoformat(m["created_at"]).strftime("%Y-%m-%d %H:%M:%S")
         
         click.echo(
-            f"{m['id']:<5} {date_str:<20} {product_display:<12} {m['movement_type']:<15} "
+            f"{m['id']:<5} {date_str:<20} {product_display:<12} {m['movement_type'].value:<15} "
             f"{m['quantity']:<10} {m['notes'] or '':<30}"
         )
 
@@ -238,10 +254,11 @@ def stock_history(product_id, movement_type):
 @cli.command("serve")
 @click.option("--host", default="127.0.0.1", help="Host to bind")
 @click.option("--port", default=8000, help="Port to bind")
-def serve(host, port):
+@click.option("--dev", is_flag=True, help="Reload the server when code changes")
+def serve(host, port, dev):
     """Start the API server"""
     click.echo(f"Starting Inventory API server at http://{host}:{port}")
-    uvicorn.run("src.api:app", host=host, port=port, reload=True)
+    uvicorn.run("src.api:app", host=host, port=port, reload=dev)
 
 
 if __name__ == "__main__":
@@ -1,7 +1,7 @@
 from enum import Enum
 from datetime import datetime
 from typing import Optional, List
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field
 
 
 class MovementType(str, Enum):
@@ -18,8 +18,7 @@ class Product(BaseModel):
     created_at: datetime = Field(default_factory=datetime.now)
     updated_at: datetime = Field(default_factory=datetime.now)
     
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True)
 
 
 class StockMovement(BaseModel):
@@ -31,8 +30,7 @@ class StockMovement(BaseModel):
     notes: Optional[str] = None
     created_at: datetime = Field(default_factory=datetime.now)
     
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True)
 
 
 class StockLevel(BaseModel):
@@ -41,8 +39,7 @@ class StockLevel(BaseModel):
     quantity: int
     last_updated: datetime = Field(default_factory=datetime.now)
     
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True)
 
 
 class Store(BaseModel):
@@ -51,5 +48,4 @@ class Store(BaseModel):
     location: str
     created_at: datetime = Field(default_factory=datetime.now)
     
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True)